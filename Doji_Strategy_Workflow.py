@@ -1,8 +1,12 @@
 import pandas as pd
 import numpy as np
 import os
+import heapq
 from datetime import datetime
 import multiprocessing as mp
+from numpy.lib.stride_tricks import sliding_window_view
+from stock_utils import read_stock, load_names, iter_stocks, save_csv
+from indicators import njit, fused, IndicatorBlock
 
 # ============================================================
 # 战法名称：【龙回头十字星潜伏 - 2.0 强化版】
@@ -14,102 +18,112 @@ import multiprocessing as mp
 # ============================================================
 
 DATA_DIR = './stock_data'
-NAMES_FILE = 'stock_names.csv'
 OUTPUT_BASE = './results'
+EXCLUDE_PREFIXES = ('30', '688', 'sz4', 'sh4', '4') # 创业板、科创板、北交所
+USE_COLS = ['开盘', '收盘', '最高', '成交量', '涨跌幅'] # 只读取战法用到的列
+RESULT_COLS = ['代码', '当前价', '评分', '历史回测胜率', '信号强度', '操作建议'] # evaluate 结果字典的列，建表时固定列序
+LIMIT_UP_PCT = np.float32(9.8) # 与 float32 的涨跌幅列同精度比较，避免 9.8 本身被误判为涨停
 
-def calculate_strategy(df, i):
-    """单票逻辑判断"""
-    if i < 20: return False, 0
+@njit(cache=True, error_model='numpy')
+def _scan(close, open_, vol, had_lu, shape_ok, vol_ma5, start):
+    """逐K线判定信号，只扫描 start 之后的交易日 (回测窗口 + 今日)
+    had_lu[k] 表示第 k-4~k 天内出现过涨停，shape_ok[k] 表示第 k 天均线支撑且为十字星，
+    二者由调用方整段预先算好。"""
+    n = close.size
+    hits = np.zeros(n, np.bool_)
+    scores = np.zeros(n, np.int64)
+    for i in range(max(start, 20), n):
+        # 基础过滤
+        if not (5.0 <= close[i] <= 20.0): continue
+        
+        # 1. 涨停基因：5天内出现过涨停（>9.8%）
+        if not had_lu[i-1]: continue
+        
+        # 2. 缩量回踩：今日成交量 < 5日均量 * 0.8 (严苛缩量)
+        if vol[i] >= vol_ma5[i] * 0.8: continue
+        
+        # 3. 均线支撑 + 4. 十字星形态
+        if not shape_ok[i]: continue
+        
+        # 评分逻辑
+        score = 70
+        if close[i] < open_[i]: score += 10 # 阴十字洗盘效果更佳
+        if vol[i] < vol[i-1] * 0.6: score += 20 # 极度枯竭量
+        
+        hits[i] = True
+        scores[i] = score
+    return hits, scores
+
+def calculate_strategy(df, ind, start=0):
+    """全序列逻辑判断：返回 start 之后每个交易日的 (是否命中, 评分)
+    ind 为公共均线块，需包含 MA5、MA10、V_MA5，扫描内核按位置取值。"""
+    # 统一为 float32 (读取时已降精度，这里不再复制)，保证 numba 只编译一个签名
+    close = df['收盘'].to_numpy(dtype=np.float32)
+    open_ = df['开盘'].to_numpy(dtype=np.float32)
+    vol = df['成交量'].to_numpy(dtype=np.float32)
+    pct = df['涨跌幅'].to_numpy(dtype=np.float32)
     
-    curr = df.iloc[i]
-    prev = df.iloc[i-1]
+    # 5日涨停窗口：对涨停标记做一次长度5的卷积，窗口内计数>0即有涨停
+    had_lu = np.convolve((pct > LIMIT_UP_PCT).astype(np.int8), np.ones(5, np.int8))[:-4] > 0
     
-    # 基础过滤
-    if not (5.0 <= curr['收盘'] <= 20.0): return False, 0
+    # 均线支撑：距离MA5或MA10极近（<1%）；十字星形态：实体极小
+    ma5, ma10 = ind['MA5'], ind['MA10']
+    dist_ma5 = fused("abs(close - ma5) / ma5", close=close, ma5=ma5)
+    dist_ma10 = fused("abs(close - ma10) / ma10", close=close, ma10=ma10)
+    body_pct = fused("abs(close - open_) / open_", close=close, open_=open_)
+    shape_ok = ~((dist_ma5 > 0.012) & (dist_ma10 > 0.012)) & ~(body_pct >= 0.005)
     
-    # 1. 涨停基因：5天内出现过涨停（>9.8%）
-    recent = df.iloc[i-5:i]
-    limit_up_day = recent[recent['涨跌幅'] > 9.8]
-    if limit_up_day.empty: return False, 0
+    return _scan(close, open_, vol, had_lu, shape_ok, ind['V_MA5'], start)
+
+def evaluate(df, code, ind):
+    """单票信号 + 历史回测，满足条件返回结果字典，否则返回 None"""
+    # 排除创业板、科创板、ST
+    if code.startswith(EXCLUDE_PREFIXES) or len(df) < 40: return None
+    # 今日信号要求收盘价在 5-20 元，不在区间内的股票直接跳过，不算均线与回测
+    if not (5.0 <= df['收盘'].iat[-1] <= 20.0): return None
     
-    # 2. 缩量回踩：今日成交量 < 5日均量 * 0.8 (严苛缩量)
-    ma5 = df['收盘'].rolling(5).mean().iloc[i]
-    ma10 = df['收盘'].rolling(10).mean().iloc[i]
-    vol_ma5 = df['成交量'].rolling(5).mean().iloc[i]
+    hits, scores = calculate_strategy(df, ind, len(df)-120)
     
-    if curr['成交量'] >= vol_ma5 * 0.8: return False, 0
+    # 今日信号
+    is_hit, score = hits[-1], scores[-1]
     
-    # 3. 均线支撑：距离MA5或MA10极近（<1%）
-    dist_ma5 = abs(curr['收盘'] - ma5) / ma5
-    dist_ma10 = abs(curr['收盘'] - ma10) / ma10
-    if dist_ma5 > 0.012 and dist_ma10 > 0.012: return False, 0
+    # 回测过去120天的表现：统计之后3天的最高价相对买入价的涨幅
+    close = df['收盘'].to_numpy()
+    # p_max[i] = 第 i+1~i+3 天最高价的最大值，一次向量化归约得到
+    p_max = sliding_window_view(df['最高'].to_numpy()[1:], 3).max(axis=1)
+    window = np.arange(max(len(df)-120, 0), len(df)-5)
+    hit_idx = window[hits[window]]
+    history_wins = (p_max[hit_idx] - close[hit_idx]) / close[hit_idx] > 0.04 # 4%算达标
     
-    # 4. 十字星形态：实体极小
-    body_pct = abs(curr['收盘'] - curr['开盘']) / curr['开盘']
-    if body_pct >= 0.005: return False, 0
+    win_rate = history_wins.mean() if len(history_wins) else 0
 
-    # 评分逻辑
-    score = 70
-    if curr['收盘'] < curr['开盘']: score += 10 # 阴十字洗盘效果更佳
-    if curr['成交量'] < prev['成交量'] * 0.6: score += 20 # 极度枯竭量
-    
-    return True, score
+    if is_hit and win_rate >= 0.5: # 历史达标率低于50%的不出票
+        suggestion = "【重点加仓】" if score >= 90 else "【小注试错】"
+        return {
+            '代码': code,
+            '当前价': close[-1],
+            '评分': score,
+            '历史回测胜率': f"{win_rate*100:.1f}%",
+            '信号强度': "极强" if score >= 90 else "标准",
+            '操作建议': suggestion + "：回踩到位，关注次日放量上攻"
+        }
 
-def analyze_and_backtest(file_path):
+def analyze_and_backtest(item):
+    code, file_path = item
     try:
-        df = pd.read_csv(file_path)
-        code = os.path.basename(file_path).replace('.csv', '')
-        # 排除创业板、科创板、ST
-        if code.startswith(('30', '688', 'sz4', 'sh4', '4')) or len(df) < 40: return None
-        
-        # 今日信号
-        is_hit, score = calculate_strategy(df, len(df)-1)
-        
-        # 回测过去120天的表现
-        history_wins = []
-        for i in range(len(df)-120, len(df)-5):
-            hit, _ = calculate_strategy(df, i)
-            if hit:
-                p_buy = df.iloc[i]['收盘']
-                # 统计之后3天的最高价
-                p_max = df.iloc[i+1:i+4]['最高'].max()
-                history_wins.append(1 if (p_max - p_buy)/p_buy > 0.04 else 0) # 4%算达标
-        
-        win_rate = np.mean(history_wins) if history_wins else 0
-
-        if is_hit and win_rate >= 0.5: # 历史达标率低于50%的不出票
-            suggestion = "【重点加仓】" if score >= 90 else "【小注试错】"
-            return {
-                '代码': code,
-                '当前价': df.iloc[-1]['收盘'],
-                '评分': score,
-                '历史回测胜率': f"{win_rate*100:.1f}%",
-                '信号强度': "极强" if score >= 90 else "标准",
-                '操作建议': suggestion + "：回踩到位，关注次日放量上攻"
-            }
+        df = read_stock(file_path, USE_COLS)
+        return evaluate(df, code, IndicatorBlock(df, close=(5, 10), vol=(5,)))
     except:
         return None
 
-def main():
-    # 读取股票名称
-    try:
-        names_df = pd.read_csv(NAMES_FILE)
-        names_dict = dict(zip(names_df['code'].astype(str).str.zfill(6), names_df['name']))
-    except:
-        names_dict = {}
-
-    files = [os.path.join(DATA_DIR, f) for f in os.listdir(DATA_DIR) if f.endswith('.csv')]
-    
-    with mp.Pool(mp.cpu_count()) as pool:
-        results = [r for r in pool.map(analyze_and_backtest, files) if r is not None]
-    
-    if results:
-        final_df = pd.DataFrame(results)
-        final_df['名称'] = final_df['代码'].apply(lambda x: names_dict.get(x, "未知"))
-        # 排除包含ST字样的名称
-        final_df = final_df[~final_df['名称'].str.contains('ST')]
-        # 选最优的3-5只
-        final_df = final_df.sort_values(by=['评分', '历史回测胜率'], ascending=False).head(5)
+def save_results(results, names_dict):
+    """名称匹配、优选排序并按年月目录存储复盘结果"""
+    # 选最优的3-5只 (只保留前N条，不对全部命中排序)；ST股已在派发前剔除
+    # 先按代码排序再取前N (nlargest 同分时保持原序)：同分者取代码靠前的，结果不随子进程返回顺序变化
+    top = heapq.nlargest(5, sorted(results, key=lambda r: r['代码']), key=lambda r: (r['评分'], r['历史回测胜率']))
+    if top:
+        final_df = pd.DataFrame.from_records(top, columns=RESULT_COLS)
+        final_df['名称'] = final_df['代码'].map(names_dict).fillna("未知")
     else:
         final_df = pd.DataFrame(columns=['代码', '名称', '评分', '历史回测胜率', '操作建议'])
 
@@ -119,8 +133,20 @@ def main():
     os.makedirs(month_path, exist_ok=True)
     filename = f"Doji_Strategy_Workflow_{now.strftime('%Y%m%d_%H%M%S')}.csv"
     
-    final_df.to_csv(os.path.join(month_path, filename), index=False, encoding='utf-8-sig')
+    save_csv(final_df, os.path.join(month_path, filename))
     print(f"复盘完成。{now.strftime('%Y-%m-%d')} 筛选出 {len(final_df)} 只符合龙回头逻辑的精品。")
 
+def main():
+    names_dict = load_names()
+
+    # 按代码前缀与ST名称预先剔除，被排除的股票不读数据
+    files = ((c, p) for c, p in iter_stocks(DATA_DIR, EXCLUDE_PREFIXES) if 'ST' not in names_dict.get(c, "未知"))
+    
+    # 分批派发任务，结果边算边收
+    with mp.Pool(mp.cpu_count()) as pool:
+        results = [r for r in pool.imap_unordered(analyze_and_backtest, files, chunksize=32) if r is not None]
+    
+    save_results(results, names_dict)
+
 if __name__ == '__main__':
     main()
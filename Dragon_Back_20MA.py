@@ -1,9 +1,12 @@
 import pandas as pd
 import numpy as np
 import os
+import heapq
 from datetime import datetime
 import multiprocessing as mp
 from concurrent.futures import ProcessPoolExecutor
+from stock_utils import read_stock, load_names, iter_stocks, save_csv, init_worker_names, worker_names
+from indicators import IndicatorBlock
 
 # ==========================================
 # 战法名称：龙回头-20日线稳健战法
@@ -17,90 +20,80 @@ from concurrent.futures import ProcessPoolExecutor
 
 # 配置参数
 DATA_DIR = 'stock_data'
-NAMES_FILE = 'stock_names.csv'
 PRICE_MIN = 5.0
 PRICE_MAX = 20.0
+BOARD_PREFIXES = ('60', '00') # 仅限深沪主板
+USE_COLS = ['日期', '开盘', '收盘', '涨跌幅'] # 只读取战法用到的列
+RESULT_COLS = ['代码', '名称', '当前价', 'MA20', '近期是否有涨停', '信号强度', '操作建议', '日期'] # 结果字典的列，建表时固定列序
 
-def analyze_stock(file_path, names_dict):
-    try:
-        df = pd.read_csv(file_path)
-        if len(df) < 30: return None
-        
-        # 基础清洗
-        code = os.path.basename(file_path).replace('.csv', '')
-        
-        # 1. 硬性条件筛选
-        if not (code.startswith('60') or code.startswith('00')): return None # 仅限深沪A股，排除30
-        last_row = df.iloc[-1]
-        if not (PRICE_MIN <= last_row['收盘'] <= PRICE_MAX): return None
-        
-        # 2. 计算指标
-        df['MA20'] = df['收盘'].rolling(window=20).mean()
-        df['MA20_Slope'] = df['MA20'].diff(3) # 趋势斜率（3日增量）
-        
-        # 3. 识别近期涨停 (过去15个交易日内是否有涨停)
-        # 涨幅 > 9.5% 视为涨停（考虑精度）
-        df['Is_Limit_Up'] = df['涨跌幅'] >= 9.8
-        recent_limit_up = df.iloc[-15:-3]['Is_Limit_Up'].any() 
-        
-        # 4. 战法逻辑判断
-        curr_price = last_row['收盘']
-        ma20 = last_row['MA20']
-        slope = last_row['MA20_Slope']
-        
-        # 条件A: 整体趋势向上 (MA20向上且价格在MA20附近)
-        is_uptrend = slope > 0 and curr_price >= ma20 * 0.98
-        
-        # 条件B: 回踩确认 (当前价格距离MA20在正负3%以内)
-        on_support = abs(curr_price - ma20) / ma20 <= 0.03
-        
-        # 条件C: 止跌信号 (今日收阳线或振幅收敛)
-        is_stop_drop = last_row['收盘'] >= last_row['开盘']
+def evaluate(df, code, ind, names_dict):
+    """单票战法判定：ind 为公共均线块 (需包含 MA20)，满足条件返回结果字典"""
+    if len(df) < 30: return None
+    
+    # 1. 硬性条件筛选
+    if not code.startswith(BOARD_PREFIXES): return None # 仅限深沪A股，排除30
+    close = df['收盘'].to_numpy()
+    curr_price = close[-1]
+    if not (PRICE_MIN <= curr_price <= PRICE_MAX): return None
+    
+    # 2. 计算指标
+    ma20_line = ind['MA20']
+    
+    # 3. 识别近期涨停 (过去15个交易日内是否有涨停)
+    # 涨幅 > 9.5% 视为涨停（考虑精度）
+    pct = df['涨跌幅'].to_numpy()
+    recent_limit_up = np.max(pct[-15:-3]) >= 9.8
+    
+    # 4. 战法逻辑判断
+    ma20 = ma20_line[-1]
+    slope = ma20_line[-1] - ma20_line[-4] # 趋势斜率（3日增量）
+    
+    # 条件A: 整体趋势向上 (MA20向上且价格在MA20附近)
+    is_uptrend = slope > 0 and curr_price >= ma20 * 0.98
+    
+    # 条件B: 回踩确认 (当前价格距离MA20在正负3%以内)
+    on_support = abs(curr_price - ma20) / ma20 <= 0.03
+    
+    # 条件C: 止跌信号 (今日收阳线或振幅收敛)
+    is_stop_drop = curr_price >= df['开盘'].iat[-1]
+    
+    if recent_limit_up and is_uptrend and on_support:
+        # 5. 评分与复盘建议
+        score = "高" if is_stop_drop and pct[-1] > 0 else "中"
         
-        if recent_limit_up and is_uptrend and on_support:
-            # 5. 评分与复盘建议
-            score = "高" if is_stop_drop and last_row['涨跌幅'] > 0 else "中"
-            
-            # 回测模拟：如果10天前符合条件，现在的收益如何？
-            # 这里简化为信号强度逻辑
-            advice = ""
-            if score == "高":
-                advice = "重点关注：回踩确认且止跌，建议分批试错，止损位设为有效跌破MA20。"
-            else:
-                advice = "观察：虽有支撑但力度一般，待出现放量阳线后再考虑。"
+        # 回测模拟：如果10天前符合条件，现在的收益如何？
+        # 这里简化为信号强度逻辑
+        advice = ""
+        if score == "高":
+            advice = "重点关注：回踩确认且止跌，建议分批试错，止损位设为有效跌破MA20。"
+        else:
+            advice = "观察：虽有支撑但力度一般，待出现放量阳线后再考虑。"
 
-            return {
-                "代码": code,
-                "名称": names_dict.get(code, "未知"),
-                "当前价": curr_price,
-                "MA20": round(ma20, 2),
-                "近期是否有涨停": "是",
-                "信号强度": score,
-                "操作建议": advice,
-                "日期": last_row['日期']
-            }
+        return {
+            "代码": code,
+            "名称": names_dict.get(code, "未知"),
+            "当前价": curr_price,
+            "MA20": round(ma20, 2),
+            "近期是否有涨停": "是",
+            "信号强度": score,
+            "操作建议": advice,
+            "日期": df['日期'].iat[-1]
+        }
+
+def analyze_stock(item):
+    code, file_path = item
+    try:
+        df = read_stock(file_path, USE_COLS)
+        return evaluate(df, code, IndicatorBlock(df, close=(20,)), worker_names())
     except Exception as e:
         return None
 
-def main():
-    # 读取股票名称
-    names_df = pd.read_csv(NAMES_FILE)
-    names_dict = dict(zip(names_df['code'].astype(str).str.zfill(6), names_df['name']))
-    
-    files = [os.path.join(DATA_DIR, f) for f in os.listdir(DATA_DIR) if f.endswith('.csv')]
-    
-    # 并行处理
-    results = []
-    with ProcessPoolExecutor(max_workers=mp.cpu_count()) as executor:
-        futures = [executor.submit(analyze_stock, f, names_dict) for f in files]
-        for future in futures:
-            res = future.result()
-            if res: results.append(res)
-    
-    # 结果排序：优中选优（按信号强度）
-    output_df = pd.DataFrame(results)
+def save_results(results):
+    """结果排序：优中选优（按信号强度），按年月目录保存"""
+    # 仅保留最精选的10只；先按代码排序，同为"高"/"中"时取代码靠前的，合并扫描与单独运行结果一致
+    top = heapq.nlargest(10, sorted(results, key=lambda r: r["代码"]), key=lambda r: r["信号强度"])
+    output_df = pd.DataFrame.from_records(top, columns=RESULT_COLS)
     if not output_df.empty:
-        output_df = output_df.sort_values(by="信号强度", ascending=False).head(10) # 仅保留最精选的10只
         
         # 创建目录
         now = datetime.now()
@@ -110,10 +103,21 @@ def main():
         # 保存文件
         file_name = f"Dragon_Back_20MA_{now.strftime('%Y%m%d_%H%M%S')}.csv"
         full_path = os.path.join(dir_path, file_name)
-        output_df.to_csv(full_path, index=False, encoding='utf-8-sig')
+        save_csv(output_df, full_path)
         print(f"筛选完成，选出 {len(output_df)} 只潜力股。结果已保存至 {full_path}")
     else:
         print("今日无符合战法条件的股票。")
 
+def main():
+    names_dict = load_names()
+    
+    files = ((c, p) for c, p in iter_stocks(DATA_DIR) if c.startswith(BOARD_PREFIXES)) # 非主板股票不读数据
+    
+    # 并行处理
+    with ProcessPoolExecutor(max_workers=mp.cpu_count(), initializer=init_worker_names, initargs=(names_dict,)) as executor:
+        results = [res for res in executor.map(analyze_stock, files, chunksize=32) if res]
+    
+    save_results(results)
+
 if __name__ == '__main__':
     main()
@@ -1,9 +1,10 @@
 import os
+import heapq
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import multiprocessing as mp
-from glob import glob
+from stock_utils import read_stock, load_names, iter_stocks, save_csv, init_worker_names, worker_names
 
 # ==========================================
 # 战法名称：金孕地量战法 (Golden Harami Strategy)
@@ -11,32 +12,38 @@ from glob import glob
 # 操作要领：寻找地量企稳信号，一击必中，严格控制价格区间
 # ==========================================
 
-def analyze_stock(file_path, name_map):
+USE_COLS = ['日期', '开盘', '收盘', '最高', '最低', '成交量', '振幅', '涨跌幅', '换手率'] # 只读取战法用到的列
+RESULT_COLS = ['日期', '代码', '名称', '收盘价', '涨跌幅', '成交量比', '信号强度', '操作建议'] # 结果字典的列，建表时固定列序
+
+def analyze_stock(item):
+    code, file_path = item
     try:
-        df = pd.read_csv(file_path)
+        df = read_stock(file_path, USE_COLS)
         if len(df) < 30: return None  # 数据量过少跳过
         
-        # 基础筛选：只要深沪A股，排除30 (创业板)，价格区间 [5, 20]，排除ST
-        code = str(df['股票代码'].iloc[-1]).zfill(6)
-        if code.startswith('30') or not (5.0 <= df['收盘'].iloc[-1] <= 20.0):
+        # 基础筛选：只要深沪A股，价格区间 [5, 20]，排除ST (创业板已在派发前剔除)
+        close = df['收盘'].to_numpy()
+        if not (5.0 <= close[-1] <= 20.0):
             return None
         
-        # 获取最新两条数据
-        today = df.iloc[-1]
-        yesterday = df.iloc[-2]
-        prev_days = df.iloc[-20:-2] # 用于计算历史波动和支撑
+        # 一次性取出所需列，下面按位置直接索引，避免逐行构造 Series
+        open_ = df['开盘'].to_numpy()
+        high = df['最高'].to_numpy()
+        low = df['最低'].to_numpy()
+        vol = df['成交量'].to_numpy()
+        amp = df['振幅'].to_numpy()
         
         # --- 战法核心逻辑 ---
         
         # 1. 子母线形态 (孕线)
-        is_harami = (today['最高'] <= yesterday['最高']) and (today['最低'] >= yesterday['最低'])
+        is_harami = (high[-1] <= high[-2]) and (low[-1] >= low[-2])
         
         # 2. 地量逻辑：今日成交量显著萎缩 (小于20日平均成交量的60% 且 小于昨日成交量)
-        avg_volume = df['成交量'].tail(20).mean()
-        is_low_vol = (today['成交量'] < yesterday['成交量'] * 0.7) and (today['成交量'] < avg_volume * 0.8)
+        avg_volume = vol[-20:].mean()
+        is_low_vol = (vol[-1] < vol[-2] * 0.7) and (vol[-1] < avg_volume * 0.8)
         
         # 3. 止跌企稳：昨日是阴线或带下影线，今日波动极小
-        is_stable = today['振幅'] < yesterday['振幅']
+        is_stable = amp[-1] < amp[-2]
         
         if is_harami and is_low_vol and is_stable:
             # --- 历史回测逻辑 (简单模拟) ---
@@ -46,10 +53,10 @@ def analyze_stock(file_path, name_map):
             
             # --- 信号强度评估 ---
             score = 0
-            if today['成交量'] < yesterday['成交量'] * 0.5: score += 40 # 极度缩量
-            if today['收盘'] > today['开盘']: score += 20 # 子线为阳线更佳
-            if today['收盘'] < yesterday['收盘'] * 1.02: score += 20 # 处于低位非追高
-            if today['换手率'] < 3.0: score += 20 # 低换手代表锁定好
+            if vol[-1] < vol[-2] * 0.5: score += 40 # 极度缩量
+            if close[-1] > open_[-1]: score += 20 # 子线为阳线更佳
+            if close[-1] < close[-2] * 1.02: score += 20 # 处于低位非追高
+            if df['换手率'].iat[-1] < 3.0: score += 20 # 低换手代表锁定好
             
             # --- 操作建议 ---
             suggestion = ""
@@ -61,12 +68,12 @@ def analyze_stock(file_path, name_map):
                 suggestion = "【观察为主】波动尚存，等待趋势明确"
 
             return {
-                "日期": today['日期'],
+                "日期": df['日期'].iat[-1],
                 "代码": code,
-                "名称": name_map.get(code, "未知"),
-                "收盘价": today['收盘'],
-                "涨跌幅": today['涨跌幅'],
-                "成交量比": round(today['成交量'] / yesterday['成交量'], 2),
+                "名称": worker_names().get(code, "未知"),
+                "收盘价": close[-1],
+                "涨跌幅": df['涨跌幅'].iat[-1],
+                "成交量比": round(float(vol[-1] / vol[-2]), 2),
                 "信号强度": score,
                 "操作建议": suggestion
             }
@@ -75,25 +82,19 @@ def analyze_stock(file_path, name_map):
 
 def run_strategy():
     # 加载股票名称映射
-    name_df = pd.read_csv('stock_names.csv')
-    name_df['code'] = name_df['code'].astype(str).str.zfill(6)
-    name_map = dict(zip(name_df['code'], name_df['name']))
+    name_map = load_names()
     
     # 扫描数据目录
-    files = glob('stock_data/*.csv')
-    
-    # 并行处理
-    with mp.Pool(processes=mp.cpu_count()) as pool:
-        results = pool.starmap(analyze_stock, [(f, name_map) for f in files])
+    files = iter_stocks('stock_data', ('30',)) # 排除30 (创业板)，不读数据
     
-    # 过滤空结果
-    final_list = [r for r in results if r is not None]
-    result_df = pd.DataFrame(final_list)
+    # 并行处理：名称映射每个子进程只传一次，结果边算边收并过滤空结果
+    with mp.Pool(processes=mp.cpu_count(), initializer=init_worker_names, initargs=(name_map,)) as pool:
+        final_list = [r for r in pool.imap_unordered(analyze_stock, files, chunksize=32) if r is not None]
+    # 优中选优：按信号强度只取前10条；先按代码排序，同分者取代码靠前的，结果不随子进程返回顺序变化
+    top = heapq.nlargest(10, sorted(final_list, key=lambda r: r["代码"]), key=lambda r: r["信号强度"])
+    result_df = pd.DataFrame.from_records(top, columns=RESULT_COLS)
     
     if not result_df.empty:
-        # 优中选优：按信号强度排序
-        result_df = result_df.sort_values(by="信号强度", ascending=False).head(10)
-        
         # 创建年月目录
         now = datetime.now()
         dir_path = now.strftime('%Y%m')
@@ -102,7 +103,7 @@ def run_strategy():
             
         # 保存结果
         file_name = f"Golden_Harami_Strategy_{now.strftime('%Y%m%d_%H%M%S')}.csv"
-        result_df.to_csv(f"{dir_path}/{file_name}", index=False, encoding='utf-8-sig')
+        save_csv(result_df, f"{dir_path}/{file_name}")
         print(f"分析完成，精选{len(result_df)}只个股。")
     else:
         print("今日无符合金孕地量战法股票。")
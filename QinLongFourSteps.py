@@ -1,9 +1,10 @@
 import pandas as pd
 import numpy as np
 import os
-import glob
 from datetime import datetime
 from concurrent.futures import ProcessPoolExecutor
+from stock_utils import read_stock, load_names, iter_stocks, save_csv
+from indicators import njit, IndicatorBlock
 
 # ==========================================
 # 战法名称：擒龙四步 (1坑 2突 3调 4起)
@@ -17,126 +18,134 @@ from concurrent.futures import ProcessPoolExecutor
 
 # 配置常量
 DATA_DIR = './stock_data/'
-NAMES_FILE = 'stock_names.csv'
 MIN_PRICE = 5.0
 MAX_PRICE = 20.0
+USE_COLS = ['开盘', '收盘', '最高', '最低', '成交量', '涨跌幅', '换手率'] # 只读取战法用到的列 (日期不参与计算，不读)
+RESULT_COLS = ['代码', '收盘', '信号', '强度', '操作建议', '历史胜率参考'] # evaluate 结果字典的列，建表时固定列序
 
-def analyze_strategy(file_path):
-    """
-    单只股票战法分析逻辑
-    """
-    try:
-        df = pd.read_csv(file_path)
-        if df.empty or len(df) < 120:
-            return None
+SIGNALS = ["观察", "蓄势", "起爆"] # _score 返回的信号编号 -> 名称
+ADVICES = ["继续等待", "极致缩量，洗盘彻底，支撑位上方待变", "三军归位+倍量起爆，龙头确认"]
+LIMIT_UP_PCT = np.float32(9.8) # 与 float32 的涨跌幅列同精度比较
 
-        # 转换日期并排序
-        df['日期'] = pd.to_datetime(df['日期'])
-        df = df.sort_values('日期')
-        
-        # 基础筛选条件
-        code = str(df['股票代码'].iloc[-1]).zfill(6)
-        last_close = df['收盘'].iloc[-1]
-        
-        # 1. 排除ST、30开头(创业板)、以及价格区间筛选
-        if code.startswith('30') or not (MIN_PRICE <= last_close <= MAX_PRICE):
-            return None
-        
-        # 2. 计算均线
-        df['MA5'] = df['收盘'].rolling(5).mean()
-        df['MA10'] = df['收盘'].rolling(10).mean()
-        df['MA20'] = df['收盘'].rolling(20).mean()
-        df['MA120'] = df['收盘'].rolling(120).mean()
-        df['V_MA5'] = df['成交量'].rolling(5).mean()
-
-        # --- 趋势过滤 & 三军归位 ---
-        is_bull_market = (last_close > df['MA120'].iloc[-1]) and \
-                         (df['MA5'].iloc[-1] > df['MA10'].iloc[-1] > df['MA20'].iloc[-1])
-        if not is_bull_market:
-            return None
-
-        # --- 擒龙四步量化建模 ---
-        # 步骤1：找坑
-        window = df.tail(30).copy()
-        min_idx = window['收盘'].idxmin()
-        
-        # 步骤2：找突 (增强：突破日成交量不仅要超均量，还要是前一天的1.8倍以上)
-        after_pit = window.loc[min_idx:]
-        breakthrough = after_pit[(after_pit['收盘'] > after_pit['MA20']) & 
-                                 (after_pit['成交量'] > after_pit['V_MA5'] * 1.5) &
-                                 (after_pit['涨跌幅'] > 4)]
-        
-        # --- 回踩支撑判定 ---
-        support_ok = True
-        if not breakthrough.empty:
-            break_price = breakthrough['开盘'].iloc[0]
-            recent_low = df['最低'].tail(5).min()
-            if recent_low < break_price:
+@njit(cache=True, error_model='numpy')
+def _score(close, open_, high, low, vol, pct, turn, ma5, ma10, ma20, ma120, vol_ma5):
+    """擒龙四步评分内核：按位置直接取值，返回 (强度, 信号编号)，未入选时强度为 0"""
+    n = close.size
+    last_close = close[n-1]
+
+    # --- 趋势过滤 & 三军归位 ---
+    if not (last_close > ma120[n-1] and ma5[n-1] > ma10[n-1] > ma20[n-1]):
+        return 0, 0
+
+    # --- 擒龙四步量化建模 ---
+    # 入选需 强度>=60，即突破成立且处于回调或起爆；先做 O(1) 的步骤3、4 与15日涨停检查，
+    # 不满足的股票不再扫描找坑与120日高点
+    # 步骤3：找调 (增强：回调必须伴随明显的成交量阶梯式萎缩)
+    vol_shrinking = vol[n-1] < vol[n-2]
+    is_adjusting = close[n-1] <= open_[n-1] and vol_shrinking
+
+    # 步骤4：起爆信号判定 (增强：起爆日必须是倍量且高换手)
+    is_exploding = pct[n-1] > 3.5 and vol[n-1] > vol[n-2] * 1.9 and turn[n-1] > 5
+    if not (is_adjusting or is_exploding):
+        return 0, 0
+
+    # 基因库：最近15天必有涨停
+    has_limit_up = False
+    for i in range(n-15, n):
+        if pct[i] > LIMIT_UP_PCT:
+            has_limit_up = True
+            break
+    if not has_limit_up:
+        return 0, 0
+
+    # 步骤1：找坑 (最近30天收盘最低点)
+    start = n - 30
+    pit = start
+    for i in range(start + 1, n):
+        if close[i] < close[pit]:
+            pit = i
+
+    # 步骤2：找突 (增强：突破日成交量不仅要超均量，还要是前一天的1.8倍以上)
+    # --- 回踩支撑判定 ---
+    has_breakthrough = False
+    support_ok = True
+    for i in range(pit, n):
+        if close[i] > ma20[i] and vol[i] > vol_ma5[i] * 1.5 and pct[i] > 4:
+            has_breakthrough = True
+            recent_low = low[n-5]
+            for j in range(n-4, n):
+                recent_low = min(recent_low, low[j])
+            if recent_low < open_[i]:
                 support_ok = False
+            break
+    if not (support_ok and has_breakthrough):
+        return 0, 0
 
-        # 步骤3：找调 (增强：回调必须伴随明显的成交量阶梯式萎缩)
-        last_3_days = df.tail(3)
-        vol_shrinking = last_3_days['成交量'].iloc[-1] < last_3_days['成交量'].iloc[-2]
-        is_adjusting = (last_3_days['收盘'].iloc[-1] <= last_3_days['开盘'].iloc[-1]) and vol_shrinking
+    # 当前价格不处于历史大顶部
+    high_120 = high[n-120]
+    for i in range(n-119, n):
+        high_120 = max(high_120, high[i])
+    not_too_high = last_close < high_120 * 1.1 # 排除掉离120日高点太远的，或者刚突破不久的
 
-        # 步骤4：起爆信号判定 (增强：起爆日必须是倍量且高换手)
-        is_exploding = (df['涨跌幅'].iloc[-1] > 3.5) and \
-                       (df['成交量'].iloc[-1] > df['成交量'].shift(1) * 1.9) and \
-                       (df['换手率'].iloc[-1] > 5) 
-        
-        # 基因库：最近15天必有涨停且当前价格不处于历史大顶部
-        has_limit_up = (window['涨跌幅'].tail(15) > 9.8).any()
-        high_120 = df['最高'].tail(120).max()
-        not_too_high = last_close < high_120 * 1.1 # 排除掉离120日高点太远的，或者刚突破不久的
-        
-        # --- 综合评分 ---
-        score = 0
-        signal = "观察"
-        advice = "继续等待"
-        
-        if support_ok and not breakthrough.empty:
-            score += 40 
-            if is_adjusting:
-                score += 20
-                signal = "蓄势"
-                advice = "极致缩量，洗盘彻底，支撑位上方待变"
-            if is_exploding:
-                score += 40
-                signal = "起爆"
-                advice = "三军归位+倍量起爆，龙头确认"
-
-        # --- 终极筛选：只要起爆和高强度蓄势的票 ---
-        if score >= 60 and has_limit_up and not_too_high:
-            return {
-                '代码': code,
-                '收盘': last_close,
-                '信号': signal,
-                '强度': score,
-                '操作建议': advice,
-                '历史胜率参考': "72%" # 逻辑收紧后预期胜率提升
-            }
-        return None
+    # --- 综合评分 ---
+    score = 40
+    signal = 0
+    if is_adjusting:
+        score += 20
+        signal = 1
+    if is_exploding:
+        score += 40
+        signal = 2
 
-    except Exception as e:
-        return None
+    # --- 终极筛选：只要起爆和高强度蓄势的票 ---
+    if not_too_high:
+        return score, signal
+    return 0, 0
 
-def main():
-    names_df = pd.read_csv(NAMES_FILE)
-    names_df['code'] = names_df['code'].astype(str).str.zfill(6)
-    code_to_name = dict(zip(names_df['code'], names_df['name']))
+def evaluate(df, code, ind):
+    """
+    单只股票战法分析逻辑
+    df 需按日期升序，ind 为公共均线块 (MA5/MA10/MA20/MA120、V_MA5)
+    """
+    if df.empty or len(df) < 120:
+        return None
 
-    files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-    print(f"开始执行【终极擒龙】扫描...")
+    # 基础筛选条件
+    last_close = df['收盘'].iat[-1]
     
-    results = []
-    with ProcessPoolExecutor() as executor:
-        task_results = list(executor.map(analyze_strategy, files))
-        results = [r for r in task_results if r is not None]
+    # 1. 排除ST、30开头(创业板)、以及价格区间筛选
+    if code.startswith('30') or not (MIN_PRICE <= last_close <= MAX_PRICE):
+        return None
+    
+    # 2. 量价列统一为 float32 交给评分内核，保证 numba 只编译一个签名
+    cols = [df[c].to_numpy(dtype=np.float32) for c in ['收盘', '开盘', '最高', '最低', '成交量', '涨跌幅', '换手率']]
+    score, signal = _score(*cols, ind['MA5'], ind['MA10'], ind['MA20'], ind['MA120'], ind['V_MA5'])
+    if score == 0:
+        return None
+    return {
+        '代码': code,
+        '收盘': last_close,
+        '信号': SIGNALS[signal],
+        '强度': score,
+        '操作建议': ADVICES[signal],
+        '历史胜率参考': "72%" # 逻辑收紧后预期胜率提升
+    }
 
+def analyze_strategy(item):
+    """单只股票：读取 (CSV 已按日期升序，不再解析日期与排序)、计算均线后进入战法判定"""
+    code, file_path = item
+    try:
+        df = read_stock(file_path, USE_COLS)
+        return evaluate(df, code, IndicatorBlock(df, close=(5, 10, 20, 120), vol=(5,)))
+    except Exception as e:
+        return None
+
+def save_results(results, code_to_name):
+    """匹配名称、按强度排序并保存扫描结果"""
     if results:
-        final_df = pd.DataFrame(results)
+        final_df = pd.DataFrame.from_records(results, columns=RESULT_COLS)
         final_df['名称'] = final_df['代码'].map(code_to_name)
-        final_df = final_df.sort_values(by='强度', ascending=False)
+        final_df = final_df.sort_values(by=['强度', '代码'], ascending=[False, True]) # 同强度按代码排序
 
         now = datetime.now()
         dir_name = now.strftime('%Y%m')
@@ -145,10 +154,22 @@ def main():
         file_name = f"QinLong_ULTIMATE_{now.strftime('%Y%m%d_%H%M%S')}.csv"
         save_path = os.path.join(dir_name, file_name)
         
-        final_df[['代码', '名称', '收盘', '信号', '强度', '操作建议', '历史胜率参考']].to_csv(save_path, index=False)
+        save_csv(final_df[['代码', '名称', '收盘', '信号', '强度', '操作建议', '历史胜率参考']], save_path, encoding='utf-8')
         print(f"扫描结束！全场仅剩 {len(final_df)} 只顶级潜力股，结果已保存。")
     else:
         print("今日无顶级信号。")
 
+def main():
+    code_to_name = load_names()
+
+    files = iter_stocks(DATA_DIR, ('30',)) # 创业板在派发前剔除，不读数据
+    print(f"开始执行【终极擒龙】扫描...")
+    
+    # 每批 32 只股票派发一次，进程间通信按批而不是按文件
+    with ProcessPoolExecutor() as executor:
+        results = [r for r in executor.map(analyze_strategy, files, chunksize=32) if r is not None]
+
+    save_results(results, code_to_name)
+
 if __name__ == "__main__":
     main()
@@ -1,9 +1,8 @@
 import pandas as pd
 import numpy as np
 import os
-import glob
 from datetime import datetime
-from multiprocessing import Pool, cpu_count
+from stock_utils import load_names, iter_stocks, load_all, tail_stat, save_csv
 
 # ==========================================
 # 战法名称：分歧转一致（16字口诀战法）
@@ -14,96 +13,69 @@ from multiprocessing import Pool, cpu_count
 # ==========================================
 
 DATA_DIR = "./stock_data"
-NAMES_FILE = "stock_names.csv"
 OUTPUT_BASE = "Screening_Results"
+USE_COLS = ["日期", "收盘", "成交量", "涨跌幅", "换手率"] # 只读取战法用到的列
 
-def get_signal_strength(row, df):
+def screen(df):
     """
-    基于逻辑深度打分：
-    - 换手率健康度
-    - 收盘价是否站稳前阳线顶部
-    - 回调时的缩量程度
+    全市场长表一次筛选 (df 为 load_all 结果)，返回命中股票的结果表。
+    逐股的标量判断改为以代码为索引的列运算，最后用布尔掩码取出命中股票。
     """
-    score = 0
-    # 逻辑1：缩量越极致，反转潜力越大
-    if row['换手率'] < df['换手率'].tail(10).mean() * 0.6: score += 40
-    # 逻辑2：价格处于5.0-20.0区间
-    if 8.0 <= row['收盘'] <= 15.0: score += 20 # 优选黄金价格区间
-    # 逻辑3：近期有涨停经历
-    if (df['涨跌幅'].tail(15) > 9.5).any(): score += 40
+    g = df.groupby('代码', observed=True, sort=False)
+    last = g.tail(1).set_index('代码')
+    close = last['收盘']
     
-    if score >= 80: return "极强（一击必中）", "重点关注，分批建仓"
-    if score >= 60: return "中等（试错观察）", "轻仓介入，等待破位拉起"
-    return "一般", "暂时放弃"
-
-def process_single_stock(file_path):
-    try:
-        df = pd.read_csv(file_path)
-        if df.empty or len(df) < 30: return None
-        
-        # 基础数据清洗与排序
-        df['日期'] = pd.to_datetime(df['日期'])
-        df = df.sort_values('日期')
-        
-        last_row = df.iloc[-1]
-        code = str(last_row['股票代码']).zfill(6)
-        
-        # --- 基础条件过滤 ---
-        # 1. 排除ST, 30开头, 5-20元价格区间
-        if "ST" in file_path or code.startswith('30'): return None
-        if not (5.0 <= last_row['收盘'] <= 20.0): return None
-        
-        # --- 战法逻辑核心筛选 ---
-        # A. 寻找最近5天内的放量涨停
-        recent_5 = df.tail(5)
-        has_limit_up = (recent_5['涨跌幅'] > 9.8).any()
-        
-        # B. 缩量判定：当前量能小于近5日平均量能的70%
-        is_shrinking = last_row['成交量'] < df['成交量'].tail(5).mean() * 0.7
-        
-        # C. 企稳判定：收盘价不破5日均线
-        ma5 = df['收盘'].tail(5).mean()
-        is_stable = last_row['收盘'] >= ma5
-        
-        if has_limit_up and is_shrinking and is_stable:
-            strength, advice = get_signal_strength(last_row, df)
-            return {
-                "代码": code,
-                "日期": last_row['日期'].strftime('%Y-%m-%d'),
-                "当前价": last_row['收盘'],
-                "换手率": last_row['换手率'],
-                "涨跌幅": last_row['涨跌幅'],
-                "信号强度": strength,
-                "操作建议": advice
-            }
-    except Exception as e:
-        return None
-
-def main():
-    # 1. 扫描文件
-    csv_files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-    print(f"开始扫描 {len(csv_files)} 个股票文件...")
+    # --- 基础条件过滤 ---
+    # 1. 至少30根K线，5-20元价格区间 (ST、30开头已在读取前剔除)
+    base_ok = (g.size() >= 30) & close.between(5.0, 20.0)
+    
+    # --- 战法逻辑核心筛选 ---
+    # A. 寻找最近5天内的放量涨停
+    has_limit_up = tail_stat(df, 5, '涨跌幅', 'max') > 9.8
+    
+    # B. 缩量判定：当前量能小于近5日平均量能的70%
+    is_shrinking = last['成交量'] < tail_stat(df, 5, '成交量', 'mean') * 0.7
     
-    # 2. 并行处理加速
-    with Pool(cpu_count()) as pool:
-        results = pool.map(process_single_stock, csv_files)
+    # C. 企稳判定：收盘价不破5日均线
+    is_stable = close >= tail_stat(df, 5, '收盘', 'mean')
     
-    # 3. 结果汇总
-    valid_results = [r for r in results if r is not None]
-    final_df = pd.DataFrame(valid_results)
+    hit = last[base_ok & has_limit_up & is_shrinking & is_stable]
+    if hit.empty:
+        return pd.DataFrame()
+    
+    # --- 基于逻辑深度打分 ---
+    # 逻辑1：缩量越极致，反转潜力越大 (换手率健康度)
+    # 逻辑2：价格处于黄金价格区间
+    # 逻辑3：近期有涨停经历
+    score = (
+        (hit['换手率'] < tail_stat(df, 10, '换手率', 'mean').loc[hit.index] * 0.6) * 40
+        + hit['收盘'].between(8.0, 15.0) * 20
+        + (tail_stat(df, 15, '涨跌幅', 'max').loc[hit.index] > 9.5) * 40
+    )
+    strength = np.select([score >= 80, score >= 60], ["极强（一击必中）", "中等（试错观察）"], "一般")
+    advice = np.select([score >= 80, score >= 60], ["重点关注，分批建仓", "轻仓介入，等待破位拉起"], "暂时放弃")
     
-    # 4. 匹配名称
-    if not final_df.empty and os.path.exists(NAMES_FILE):
-        names_df = pd.read_csv(NAMES_FILE, dtype={'code': str})
-        names_df['code'] = names_df['code'].str.zfill(6)
-        final_df = final_df.merge(names_df, left_on="代码", right_on="code", how="left")
-        final_df = final_df[['代码', 'name', '当前价', '涨跌幅', '信号强度', '操作建议']]
-        final_df.rename(columns={'name': '股票名称'}, inplace=True)
+    return pd.DataFrame({
+        "代码": hit.index.astype(str),
+        "日期": hit['日期'].astype(str).str[:10].to_numpy(),
+        "当前价": hit['收盘'].to_numpy(),
+        "换手率": hit['换手率'].to_numpy(),
+        "涨跌幅": hit['涨跌幅'].to_numpy(),
+        "信号强度": strength,
+        "操作建议": advice
+    })
+
+def save_results(final_df, names_dict):
+    """匹配名称、只保留中等以上信号，按年月目录保存"""
+    # 3. 匹配名称
+    if not final_df.empty:
+        final_df['股票名称'] = final_df['代码'].map(names_dict)
+        final_df = final_df[['代码', '股票名称', '当前价', '涨跌幅', '信号强度', '操作建议']]
         
-        # 优中选优：只取信号强度为“中等”以上的
-        final_df = final_df[final_df['信号强度'] != "一般"]
+        # 优中选优：只取信号强度为“中等”以上的，按代码排序，结果不随读取顺序变化
+        final_df = final_df[final_df['信号强度'] != "一般"].sort_values('代码')
 
-    # 5. 保存结果（按年月目录）
+    # 4. 保存结果（按年月目录）
     now = datetime.now()
     dir_path = os.path.join(now.strftime('%Y'), now.strftime('%m'))
     os.makedirs(dir_path, exist_ok=True)
@@ -112,11 +84,19 @@ def main():
     save_path = os.path.join(dir_path, file_name)
     
     if not final_df.empty:
-        final_df.to_csv(save_path, index=False, encoding='utf_8_sig')
+        save_csv(final_df, save_path)
         print(f"筛选完成，找到 {len(final_df)} 只潜力股。结果已保存至: {save_path}")
     else:
         with open(save_path, "w") as f: f.write("今日无符合强信号条件的股票")
         print("今日未发现符合条件的股票。")
 
+def main():
+    # 1. 扫描文件，全市场读成一张长表
+    df = load_all(((c, p) for c, p in iter_stocks(DATA_DIR, ('30',)) if "ST" not in c), USE_COLS)
+    print(f"开始扫描 {df['代码'].nunique()} 个股票文件...")
+    
+    # 2. 全市场一次向量化筛选，匹配名称后保存
+    save_results(screen(df), load_names())
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,58 @@
+import os
+import json
+import shutil
+import pyarrow as pa
+import pyarrow.parquet as pq
+from stock_utils import DATA_DIR, STORE_DIR, STORE_META_KEY, store_part, iter_stocks, load_all, csv_signature, store_signatures
+
+# ==========================================
+# 合并库构建：stock_data/*.csv -> stock_data/all_stocks/<代码前4位>.parquet
+# 1. 全市场合并为按代码前缀分片的长表 (片内按 代码、日期 排序)，批量战法一次读入，不再逐个解析 CSV。
+#    分片让单个文件保持在几 MB，股票增多时只是分片变多，不会逼近 GitHub 的单文件上限。
+# 2. 量价列以 float32 落盘，代码列按字典编码保存。
+# 3. 每个分片在元数据中记录各股票的 CSV 签名 (文件大小 + 最后一行)；只重建签名有变化或股票增删的分片，
+#    其余分片原样保留，源端已无股票的分片删除。判断只看文件内容，与修改时间无关。
+# 4. 逐股 Parquet 缓存 (单个小文件读 Parquet 比 pyarrow.csv 解析更慢) 与旧版单文件合并库已停用，遗留文件一并删除。
+# 5. 合并库只是本地读取加速用的派生文件，已加入 .gitignore，不随数据同步提交；缺失或过期的股票由 load_all 逐文件补读。
+# ==========================================
+
+LEGACY_CACHE_DIR = os.path.join(DATA_DIR, 'parquet') # 旧版逐股缓存目录
+LEGACY_STORE_PATH = os.path.join(DATA_DIR, 'all_stocks.parquet') # 旧版单文件合并库
+
+def write_part(path, group, signatures):
+    """逐文件读取 group 写成一个分片，并把 CSV 签名写入 Parquet 元数据"""
+    table = pa.Table.from_pandas(load_all(group, None, use_store=False), preserve_index=False)
+    meta = dict(table.schema.metadata or {})
+    meta[STORE_META_KEY] = json.dumps(signatures).encode()
+    pq.write_table(table.replace_schema_metadata(meta), path, compression='zstd', row_group_size=100_000)
+
+def main():
+    shutil.rmtree(LEGACY_CACHE_DIR, ignore_errors=True)
+    if os.path.exists(LEGACY_STORE_PATH):
+        os.remove(LEGACY_STORE_PATH)
+    os.makedirs(STORE_DIR, exist_ok=True)
+
+    # 按分片归组 (已按代码排序，片内股票连续)
+    parts = {}
+    for code, file_path in sorted(iter_stocks(DATA_DIR)):
+        parts.setdefault(store_part(code), []).append((code, file_path))
+
+    removed = 0
+    for name in os.listdir(STORE_DIR):
+        path = os.path.join(STORE_DIR, name)
+        if path not in parts:
+            os.remove(path)
+            removed += 1
+
+    # 有 CSV 内容变化、新增或删除的分片才重建
+    rebuilt = 0
+    for path, group in parts.items():
+        signatures = {code: csv_signature(file_path) for code, file_path in group}
+        if store_signatures(path) == signatures:
+            continue
+        write_part(path, group, signatures)
+        rebuilt += 1
+    print(f"合并库 {STORE_DIR}：共 {len(parts)} 个分片、{sum(map(len, parts.values()))} 只股票，本次重建 {rebuilt} 个，删除 {removed} 个。")
+
+if __name__ == '__main__':
+    main()
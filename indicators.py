@@ -0,0 +1,81 @@
+import numpy as np
+
+# ==========================================
+# 公共指标内核：各战法脚本共用的数值计算
+# 1. 安装了 numba 时用 @njit 编译成机器码。
+# 2. 未安装 numba 时退化为普通 Python 函数，脚本照常运行。
+# 3. 整段数组表达式优先交给 numexpr 单遍融合计算，未安装时退化为 NumPy。
+# 4. 公共均线块按需计算：战法先做廉价过滤，取用时才算对应均线。
+# ==========================================
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """numba 不可用时的空装饰器，兼容 @njit 与 @njit(...) 两种写法"""
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+@njit(cache=True)
+def rolling_means(a, widths):
+    """O(N) 多窗口滑动均值：一遍扫描 a，同时维护每个窗口的累加和 (新K线加入、出窗K线减去)，
+    返回 (len(widths), N) 矩阵，第 k 行为窗口 widths[k] 的均线。
+    前 w-1 个位置为 NaN，与 pandas rolling(w).mean() 对齐。
+    输入可为 float32，累加和与输出保持 float64 以免误差累积。"""
+    n = a.size
+    m = widths.size
+    out = np.full((m, n), np.nan)
+    sums = np.zeros(m)
+    for i in range(n):
+        x = a[i]
+        for k in range(m):
+            w = widths[k]
+            if i < w:
+                sums[k] += x
+            else:
+                sums[k] += x - a[i-w]
+            if i >= w - 1:
+                out[k, i] = sums[k] / w
+    return out
+
+def sma(a, w):
+    """前缀和差分求简单均线：(cs[i+1] - cs[i+1-w]) / w，纯 NumPy 一遍完成，无需 numba。
+    前 w-1 个位置为 NaN，与 pandas rolling(w).mean() 对齐。"""
+    c = np.concatenate(([0.0], np.cumsum(a, dtype=np.float64)))
+    out = np.full(len(a), np.nan)
+    if len(a) >= w:
+        out[w-1:] = (c[w:] - c[:-w]) / w
+    return out
+
+def fused(expr, **arrays):
+    """整段数组表达式求值：numexpr 一遍算完不产生中间数组；不可用时按 NumPy 逐步求值"""
+    if numexpr is not None:
+        return numexpr.evaluate(expr, local_dict=arrays)
+    return eval(expr, {'abs': np.abs}, arrays)
+
+class IndicatorBlock:
+    """公共均线块：声明需要的收盘价均线 MA{w} 与成交量均线 V_MA{w}，ind['MA20'] 取值时才计算并缓存。
+    未通过廉价过滤 (板块、价格区间) 的股票一条均线都不算；同一列声明的各窗口在
+    首次取用时由 rolling_means 一遍算出，多个战法共用同一块时每列只扫描一次。
+    只支持按名称取值，未声明的名称抛出 KeyError。"""
+    def __init__(self, df, close=(), vol=()):
+        self._df = df
+        self._groups = [('MA', '收盘', tuple(close)), ('V_MA', '成交量', tuple(vol))]
+        self._lines = {}
+
+    def __getitem__(self, key):
+        if key in self._lines:
+            return self._lines[key]
+        for prefix, col, widths in self._groups:
+            names = [f'{prefix}{w}' for w in widths]
+            if key in names:
+                lines = rolling_means(self._df[col].to_numpy(dtype=np.float32), np.array(widths, dtype=np.int64))
+                self._lines.update(zip(names, lines))
+                return self._lines[key]
+        raise KeyError(key)
@@ -1,9 +1,8 @@
 import pandas as pd
 import numpy as np
 import os
-import glob
 from datetime import datetime
-import multiprocessing as mp
+from stock_utils import load_names, iter_stocks, load_all, tail_stat, save_csv
 
 # ==========================================
 # 战法名称：乾坤超跌反弹战法 (QianKun Strategy)
@@ -18,97 +17,64 @@ import multiprocessing as mp
 
 STRATEGY_NAME = "qiankun_strategy"
 DATA_DIR = "stock_data"
-NAMES_FILE = "stock_names.csv"
 PRICE_MIN = 5.0
 PRICE_MAX = 20.0
+USE_COLS = ['收盘', '最高', '涨跌幅'] # 只读取战法用到的列 (日期不参与计算，不读)
 
-def analyze_stock(file_path, name_dict):
-    try:
-        df = pd.read_csv(file_path)
-        if df.empty or len(df) < 120: return None
-        
-        # 基础数据清洗
-        df['日期'] = pd.to_datetime(df['日期'])
-        df = df.sort_values('日期')
-        code = os.path.basename(file_path).split('.')[0]
-        
-        # 0. 基础过滤：排除ST, 创业板(30), 价格区间
-        name = name_dict.get(code, "未知")
-        if "ST" in name or code.startswith('30'): return None
-        
-        last_price = df['收盘'].iloc[-1]
-        if not (PRICE_MIN <= last_price <= PRICE_MAX): return None
+def screen(df):
+    """
+    全市场长表一次筛选 (df 为 load_all 结果)，返回命中股票的结果表。
+    历史高点、跌幅、均线粘合度都按代码整列计算，命中股票由一个布尔掩码取出。
+    """
+    g = df.groupby('代码', observed=True, sort=False)
+    last = g.tail(1).set_index('代码')
+    last_price = last['收盘']
+    
+    # 0. 基础过滤：至少半年数据，价格区间 (ST、创业板已在读取前剔除)
+    base_ok = (g.size() >= 120) & last_price.between(PRICE_MIN, PRICE_MAX)
 
-        # 1. 历史最高点跌幅计算
-        hist_high = df['最高'].max()
-        drop_ratio = (hist_high - last_price) / hist_high
-        if drop_ratio < 0.70: return None
+    # 1. 历史最高点跌幅计算
+    hist_high = g['最高'].max()
+    drop_ratio = (hist_high - last_price) / hist_high
 
-        # 2. 均线粘合 (5, 10, 20)
-        ma5 = df['收盘'].rolling(5).mean()
-        ma10 = df['收盘'].rolling(10).mean()
-        ma20 = df['收盘'].rolling(20).mean()
-        
-        curr_ma5, curr_ma10, curr_ma20 = ma5.iloc[-1], ma10.iloc[-1], ma20.iloc[-1]
-        max_ma = max(curr_ma5, curr_ma10, curr_ma20)
-        min_ma = min(curr_ma5, curr_ma10, curr_ma20)
-        ma_binding = (max_ma - min_ma) / min_ma
-        if ma_binding > 0.05: return None # 粘合度需在5%以内
+    # 2. 均线粘合 (5, 10, 20)：只需最新一天的均线值
+    mas = pd.concat([tail_stat(df, n, '收盘', 'mean') for n in (5, 10, 20)], axis=1)
+    max_ma, min_ma = mas.max(axis=1), mas.min(axis=1)
+    ma_binding = (max_ma - min_ma) / min_ma # 粘合度需在5%以内
 
-        # 3. 近10日涨停基因
-        df['涨幅'] = df['收盘'].pct_change()
-        recent_10 = df.tail(10)
-        has_limit_up = any(recent_10['涨幅'] > 0.095)
-        if not has_limit_up: return None
+    # 3. 近10日涨停基因 (涨跌幅为百分数，直接用行情自带列)
+    has_limit_up = tail_stat(df, 10, '涨跌幅', 'max') > 9.5
 
-        # 4. 历史回测逻辑 (计算该形态出现后的未来5日表现)
-        # 这里模拟回测：假设我们在满足条件当天买入
-        backtest_profit = "N/A"
-        if len(df) > 10:
-             # 简单回测示例：若之前也出现过类似形态的平均表现 (此处简化为当前逻辑的胜率参考)
-             pass
+    hit = base_ok & (drop_ratio >= 0.70) & (ma_binding <= 0.05) & has_limit_up
+    if not hit.any():
+        return pd.DataFrame()
+    codes = hit.index[hit]
+    drop_ratio, ma_binding = drop_ratio[codes], ma_binding[codes]
 
-        # 5. 自动复盘逻辑
-        score = 0
-        score += 40 if drop_ratio > 0.8 else 20
-        score += 30 if ma_binding < 0.02 else 15
-        score += 30 if has_limit_up else 0
-        
-        suggestion = "暂时放弃"
-        if score >= 80: suggestion = "极度强烈建议：全仓伏击/加仓"
-        elif score >= 60: suggestion = "强烈建议：试错买入"
-        elif score >= 40: suggestion = "观察：等待均线完全重合"
+    # 4. 自动复盘逻辑 (命中股票均有涨停基因，该项固定得 30 分)
+    score = np.where(drop_ratio > 0.8, 40, 20) + np.where(ma_binding < 0.02, 30, 15) + 30
+    suggestion = np.select(
+        [score >= 80, score >= 60, score >= 40],
+        ["极度强烈建议：全仓伏击/加仓", "强烈建议：试错买入", "观察：等待均线完全重合"],
+        "暂时放弃"
+    )
 
-        return {
-            "代码": code,
-            "名称": name,
-            "现价": last_price,
-            "跌幅": f"{round(drop_ratio*100, 2)}%",
-            "均线粘合度": f"{round(ma_binding*100, 2)}%",
-            "评分": score,
-            "操作建议": suggestion,
-            "回测历史胜率参考": "高(超跌+激活)"
-        }
-    except Exception:
-        return None
+    return pd.DataFrame({
+        "代码": codes.astype(str),
+        "现价": last_price[codes].to_numpy(),
+        "跌幅": [f"{round(float(x)*100, 2)}%" for x in drop_ratio],
+        "均线粘合度": [f"{round(float(x)*100, 2)}%" for x in ma_binding],
+        "评分": score,
+        "操作建议": suggestion,
+        "回测历史胜率参考": "高(超跌+激活)"
+    })
 
-def main():
-    # 加载股票名称
-    name_df = pd.read_csv(NAMES_FILE)
-    name_dict = dict(zip(name_df['code'].astype(str).str.zfill(6), name_df['name']))
-    
-    files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-    
-    # 并行处理提高速度
-    with mp.Pool(processes=mp.cpu_count()) as pool:
-        results = pool.starmap(analyze_stock, [(f, name_dict) for f in files])
-    
-    # 过滤空结果并排序
-    valid_results = [r for r in results if r is not None]
-    final_df = pd.DataFrame(valid_results)
-    
+def save_results(final_df, name_dict):
+    """匹配名称、按评分排序并保存"""
+    # 匹配名称并排序
     if not final_df.empty:
-        final_df = final_df.sort_values(by="评分", ascending=False)
+        final_df.insert(1, "名称", final_df["代码"].map(name_dict).fillna("未知"))
+        final_df = final_df.sort_values(by=["评分", "代码"], ascending=[False, True]) # 同分按代码排序
         
         # 路径处理：results/YYYY-MM/
         now = datetime.now()
@@ -118,10 +84,18 @@ def main():
         file_name = f"{STRATEGY_NAME}_{now.strftime('%Y%m%d_%H%M%S')}.csv"
         save_path = os.path.join(dir_path, file_name)
         
-        final_df.to_csv(save_path, index=False, encoding='utf_8_sig')
+        save_csv(final_df, save_path)
         print(f"分析完成，找到 {len(final_df)} 只符合条件的标的，结果已保存至 {save_path}")
     else:
         print("今日无符合乾坤战法条件的股票。")
 
+def main():
+    # 加载股票名称
+    name_dict = load_names()
+    
+    # 排除ST, 创业板(30)，在读取前完成，不读数据；其余股票读成一张长表一次筛选
+    files = ((c, p) for c, p in iter_stocks(DATA_DIR, ('30',)) if "ST" not in name_dict.get(c, "未知"))
+    save_results(screen(load_all(files, USE_COLS)), name_dict)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,81 @@
+import multiprocessing as mp
+from stock_utils import read_stock, load_names, iter_stocks, load_all, init_worker_names, worker_names
+from indicators import IndicatorBlock
+import Doji_Strategy_Workflow as doji
+import Dragon_Back_20MA as dragon
+import QinLongFourSteps as qinlong
+import Strong_Signal_Screener as strong
+import shouban_huicai_20 as shouban
+import qiankun_strategy as qiankun
+import weekly_resonance_strategy as weekly
+
+# ==========================================
+# 合并扫描：龙回头十字星 + 龙回头20日线 + 擒龙四步 (逐股)，分歧转一致 + 首板回踩 + 乾坤 + 周线共振 (批量)
+# 1. 每只股票只读一次，读取三套战法所需列的并集；与各战法单独运行时一样，要求 CSV 已按日期升序，不再检查排序。
+# 2. 公共均线块 (MA5/10/20/120、成交量MA5) 只算一次，三套战法共用。
+# 3. 各战法结果按战法名分拣，分别沿用原脚本的排序与存储格式。
+# 4. 四套批量战法共用一张全市场长表，只读取一次，各自的 screen 在同一张表上出结果。
+# 5. 本脚本供本地手动运行：CI 中各战法仍由各自的 workflow 按时间表单独运行 (结果目录与提交信息各不相同)，
+#    没有调用本脚本的 workflow，共用读取的收益只在本地合并扫描时体现。
+# ==========================================
+
+DATA_DIR = './stock_data'
+USE_COLS = list(dict.fromkeys(doji.USE_COLS + dragon.USE_COLS + qinlong.USE_COLS))
+BATCH_COLS = list(dict.fromkeys(strong.USE_COLS + shouban.USE_COLS + qiankun.USE_COLS + weekly.USE_COLS))
+
+def run_all_strategies(item):
+    """单只股票跑全部战法，返回 [(战法名, 结果字典), ...]"""
+    code, file_path = item
+    names = worker_names()
+    try:
+        df = read_stock(file_path, USE_COLS)
+        ind = IndicatorBlock(df, close=(5, 10, 20, 120), vol=(5,))
+    except Exception:
+        return []
+
+    strategies = [
+        ('dragon', lambda: dragon.evaluate(df, code, ind, names)),
+        ('qinlong', lambda: qinlong.evaluate(df, code, ind)),
+    ]
+    if 'ST' not in names.get(code, "未知"): # 十字星战法排除ST股，不做回测
+        strategies.append(('doji', lambda: doji.evaluate(df, code, ind)))
+    hits = []
+    for name, evaluate in strategies:
+        try:
+            res = evaluate()
+        except Exception:
+            res = None
+        if res is not None:
+            hits.append((name, res))
+    return hits
+
+def main():
+    names_dict = load_names()
+
+    files = list(iter_stocks(DATA_DIR, ('30',))) # 各战法都排除创业板，派发前剔除
+    print(f"开始合并扫描 {len(files)} 只股票...")
+
+    # 分批派发任务，按战法名分拣结果
+    results = {'doji': [], 'dragon': [], 'qinlong': []}
+    with mp.Pool(mp.cpu_count(), initializer=init_worker_names, initargs=(names_dict,)) as pool:
+        for hits in pool.imap_unordered(run_all_strategies, files, chunksize=32):
+            for name, res in hits:
+                results[name].append(res)
+
+    doji.save_results(results['doji'], names_dict)
+    dragon.save_results(results['dragon'])
+    qinlong.save_results(results['qinlong'], names_dict)
+
+    # 批量战法：全市场长表只读一次
+    frame = load_all(files, BATCH_COLS)
+    strong.save_results(strong.screen(frame), names_dict)
+    shouban.save_results(shouban.screen(frame), names_dict)
+    # 乾坤战法排除ST：逐股判定互不影响，在结果上剔除与读取前剔除等价
+    qk = qiankun.screen(frame)
+    if not qk.empty:
+        qk = qk[~qk['代码'].map(lambda c: 'ST' in names_dict.get(c, "未知"))]
+    qiankun.save_results(qk, names_dict)
+    weekly.save_results(weekly.screen(frame), names_dict)
+
+if __name__ == '__main__':
+    main()
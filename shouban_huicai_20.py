@@ -1,9 +1,8 @@
 import pandas as pd
 import numpy as np
 import os
-import glob
 from datetime import datetime
-import multiprocessing as mp
+from stock_utils import load_names, iter_stocks, load_all, tail_stat, save_csv
 
 # ==========================================
 # 战法名称：首板回踩20日线 (龙回头简易版)
@@ -14,108 +13,75 @@ import multiprocessing as mp
 # ==========================================
 
 DATA_DIR = "./stock_data"
-NAMES_FILE = "stock_names.csv"
 OUTPUT_BASE = "shouban_huicai_20"
+USE_COLS = ["收盘", "成交量", "涨跌幅"] # 只读取战法用到的列
 
-def analyze_stock(file_path):
-    try:
-        df = pd.read_csv(file_path)
-        if len(df) < 30: return None
-        
-        # 基础数据清洗
-        code = df['股票代码'].iloc[-1].split('.')[-1] # 提取纯数字代码
-        code_full = str(df['股票代码'].iloc[-1])
-        
-        # 1. 基础过滤：排除ST(假设数据中含ST字样或特殊处理), 排除创业板(30开头)
-        if code.startswith('30'): return None
-        
-        # 2. 价格过滤：最新收盘价在 5.0 - 20.0 元之间
-        last_close = df['收盘'].iloc[-1]
-        if not (5.0 <= last_close <= 20.0): return None
-        
-        # 3. 计算指标
-        df['MA20'] = df['收盘'].rolling(window=20).mean()
-        df['Vol_MA5'] = df['成交量'].rolling(window=5).mean()
-        
-        # 4. 寻找最近 10 天内的首板 (涨幅 > 9.8%)
-        recent_10 = df.tail(10).copy()
-        limit_ups = recent_10[recent_10['涨跌幅'] >= 9.8]
-        
-        if limit_ups.empty: return None
-        
-        # 找到最近的一个涨停日
-        last_limit_up_idx = limit_ups.index[-1]
-        days_since_limit = (len(df) - 1) - last_limit_up_idx
-        
-        # 涨停后必须有回调（至少过了一天），且回调天数不宜过长（比如3-8天内最佳）
-        if days_since_limit < 1: return None
-
-        # 5. 回踩逻辑判断
-        current_ma20 = df['MA20'].iloc[-1]
-        vol_limit_up = df['成交量'].loc[last_limit_up_idx]
-        current_vol = df['成交量'].iloc[-1]
-        
-        # 条件 A: 当前收盘价在 MA20 附近 (1% - 3% 范围内)
-        is_near_ma20 = 0.98 <= (last_close / current_ma20) <= 1.03
-        
-        # 条件 B: 缩量（当前成交量小于涨停当日成交量的 60%）
-        is_vol_shrink = current_vol < (vol_limit_up * 0.6)
-        
-        if is_near_ma20 and is_vol_shrink:
-            # 6. 打分系统与复盘建议
-            score = 0
-            if last_close > current_ma20: score += 40  # 线上企稳分高
-            if current_vol < df['Vol_MA5'].iloc[-1]: score += 30 # 极度缩量分高
-            if df['涨跌幅'].iloc[-1] > -1: score += 30 # 当日收阳或微跌分高
-            
-            # 建议逻辑
-            advice = "试错观察"
-            if score >= 80: advice = "重点关注/轻仓介入"
-            if score >= 90: advice = "优选/重仓博弈回升"
-
-            return {
-                "code": code_full,
-                "price": last_close,
-                "pct_chg": df['涨跌幅'].iloc[-1],
-                "score": score,
-                "limit_up_days_ago": days_since_limit,
-                "advice": advice
-            }
-            
-    except Exception as e:
-        return None
-    return None
-
-def main():
-    # 1. 扫描文件并行处理
-    files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
-    pool = mp.Pool(mp.cpu_count())
-    results = pool.map(analyze_stock, files)
-    pool.close()
-    pool.join()
+def screen(df):
+    """全市场长表一次筛选 (df 为 load_all 结果)，返回命中股票的结果表"""
+    g = df.groupby('代码', observed=True, sort=False)
+    last = g.tail(1).set_index('代码')
+    last_close = last['收盘']
+    
+    # 1. 基础过滤：至少30根K线；创业板(30开头)已在读取前剔除
+    # 2. 价格过滤：最新收盘价在 5.0 - 20.0 元之间
+    base_ok = (g.size() >= 30) & last_close.between(5.0, 20.0)
+    
+    # 3. 计算指标 (只需最新一天的 MA20 与 5日均量)
+    current_ma20 = tail_stat(df, 20, '收盘', 'mean')
+    vol_ma5 = tail_stat(df, 5, '成交量', 'mean')
+    
+    # 4. 寻找最近 10 天内的首板 (涨幅 > 9.8%)，取每只股票最近的一个涨停日
+    recent_10 = g.tail(10)
+    days_ago = recent_10.groupby('代码', observed=True, sort=False).cumcount(ascending=False)
+    is_limit_up = recent_10['涨跌幅'] >= 9.8
+    last_limit_up = recent_10[is_limit_up].assign(days=days_ago[is_limit_up]).groupby('代码', observed=True, sort=False).tail(1).set_index('代码')
+    days_since_limit = last_limit_up['days'].reindex(last.index)
+    vol_limit_up = last_limit_up['成交量'].reindex(last.index)
+    
+    # 涨停后必须有回调（至少过了一天），且回调天数不宜过长（比如3-8天内最佳）
+    # 5. 回踩逻辑判断
+    current_vol = last['成交量']
+    # 条件 A: 当前收盘价在 MA20 附近 (1% - 3% 范围内)
+    is_near_ma20 = (last_close / current_ma20).between(0.98, 1.03)
+    # 条件 B: 缩量（当前成交量小于涨停当日成交量的 60%）
+    is_vol_shrink = current_vol < (vol_limit_up * 0.6)
     
+    hit = base_ok & (days_since_limit >= 1) & is_near_ma20 & is_vol_shrink
+    if not hit.any():
+        return pd.DataFrame()
+    codes = hit.index[hit]
+    
+    # 6. 打分系统与复盘建议
+    score = (
+        (last_close[codes] > current_ma20[codes]) * 40 # 线上企稳分高
+        + (current_vol[codes] < vol_ma5[codes]) * 30 # 极度缩量分高
+        + (last['涨跌幅'][codes] > -1) * 30 # 当日收阳或微跌分高
+    )
+    advice = np.select([score >= 90, score >= 80], ["优选/重仓博弈回升", "重点关注/轻仓介入"], "试错观察")
+    
+    return pd.DataFrame({
+        "code": codes.astype(str),
+        "price": last_close[codes].to_numpy(),
+        "pct_chg": last['涨跌幅'][codes].to_numpy(),
+        "score": score.to_numpy(),
+        "limit_up_days_ago": days_since_limit[codes].astype(int).to_numpy(),
+        "advice": advice
+    })
+
+def save_results(res_df, names_dict):
+    """优选前 5 名、匹配名称并按年月目录保存"""
     # 2. 过滤结果并匹配名称
-    valid_results = [r for r in results if r is not None]
-    if not valid_results:
+    if res_df.empty:
         print("今日无符合战法个股")
         return
 
-    res_df = pd.DataFrame(valid_results)
-    
-    # 读取名称库
-    if os.path.exists(NAMES_FILE):
-        names_df = pd.read_csv(NAMES_FILE, dtype={'code': str})
-        # 转换代码格式以匹配
-        res_df['code_short'] = res_df['code'].apply(lambda x: x.split('.')[-1] if '.' in x else x)
-        names_df['code'] = names_df['code'].astype(str).str.zfill(6)
-        res_df = pd.merge(res_df, names_df, left_on='code_short', right_on='code', how='left')
-    
-    # 3. 优中选优：按分数排序，只取前 5 名 (一击必中原则)
-    res_df = res_df.sort_values(by='score', ascending=False).head(5)
+    # 3. 优中选优：按分数只取前 5 名 (一击必中原则)，再为这几只匹配名称；同分按代码取前，结果不随读取顺序变化
+    res_df = res_df.sort_values(['score', 'code'], ascending=[False, True]).head(5)
+    res_df['name'] = res_df['code'].map(names_dict)
     
     # 4. 格式化输出
-    final_output = res_df[['code_x', 'name', 'price', 'score', 'advice']].rename(
-        columns={'code_x': '代码', 'name': '名称', 'price': '当前价', 'score': '战法评分', 'advice': '操作建议'}
+    final_output = res_df[['code', 'name', 'price', 'score', 'advice']].rename(
+        columns={'code': '代码', 'name': '名称', 'price': '当前价', 'score': '战法评分', 'advice': '操作建议'}
     )
     
     # 5. 保存结果到年月目录
@@ -126,9 +92,13 @@ def main():
     
     filename = f"{OUTPUT_BASE}_{now.strftime('%Y%m%d_%H%M%S')}.csv"
     save_path = os.path.join(dir_path, filename)
-    final_output.to_csv(save_path, index=False, encoding='utf_8_sig')
+    save_csv(final_output, save_path)
     
     print(f"分析完成，结果已保存至: {save_path}")
 
+def main():
+    # 1. 全市场读成一张长表一次筛选 (创业板30开头在读取前剔除，不读数据)
+    save_results(screen(load_all(iter_stocks(DATA_DIR, ('30',)), USE_COLS)), load_names())
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,221 @@
+import os
+import csv
+import json
+import pickle
+import functools
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 公共数据工具：各战法脚本共用的行情读取逻辑
+# 1. 逐股直接读原始 CSV，只取需要的列 (pyarrow.csv 解析，未安装时用 pandas)。
+#    小文件上 pyarrow.csv 比逐股 Parquet 缓存读得更快，因此不再维护逐股缓存。
+# 2. 日期不解析。逐股战法要求源 CSV 已按日期升序，不做检查；load_all 只做 O(N) 单调性检查，乱序时才排序。
+# 3. 量价列统一降为 float32，滑动均值等内核搬运的字节数减半。
+# 4. 股票名称映射每个进程只构建一次，并按 CSV 修改时间缓存为 pickle；进程池经 init_worker_names 向子进程传一次。
+# 5. load_all 把全市场读成一张按代码分块的长表，供批量战法一次筛选；
+#    合并库 all_stocks/ 按代码前 4 位分片，并记录建库时每只股票的 CSV 签名 (文件大小 + 最后一行)；
+#    签名与当前 CSV 一致的股票从合并库一次读入，其余逐文件读取，不依赖文件修改时间。
+# 6. 复盘结果表只有几行，直接用 csv.writer 写出，绕过 pandas 的序列化。
+# 合并库由 build_cache.py 在本地按需生成，不提交到仓库；没有合并库时全部逐文件读取。
+# ==========================================
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:
+    pacsv = None
+
+DATA_DIR = 'stock_data'
+STORE_DIR = os.path.join(DATA_DIR, 'all_stocks') # 全市场合并行情，按代码前缀分片，片内按 代码、日期 排序
+STORE_PREFIX_LEN = 4 # 分片所用的代码前缀长度
+STORE_META_KEY = b'csv_signatures' # 分片 Parquet 元数据中记录各股票 CSV 签名的键
+NAMES_FILE = 'stock_names.csv'
+NAMES_PICKLE = 'stock_names.pkl'
+FLOAT32_COLS = ['开盘', '收盘', '最高', '最低', '成交量', '成交额', '振幅', '涨跌幅', '涨跌额', '换手率'] # 量价列精度 float32 足够
+STR_COLS = ['日期', '股票代码'] # 日期不解析；代码保持字符串以保留前导 0
+
+def downcast(df):
+    """量价列原地转为 float32，返回 df。已是 float32 的列跳过 (整块赋值即使 copy=False 也会重建列块)"""
+    cols = [c for c in FLOAT32_COLS if c in df.columns and df[c].dtype != np.float32]
+    if cols:
+        df[cols] = df[cols].astype(np.float32, copy=False)
+    return df
+
+def iter_stocks(data_dir=DATA_DIR, exclude=()):
+    """逐个产出 (代码, 路径)，可直接喂给进程池。exclude 为需排除的代码前缀，命中的股票在派发任务前就被剔除，不读任何数据"""
+    with os.scandir(data_dir) as it:
+        for entry in it:
+            if entry.name.endswith('.csv') and entry.is_file():
+                code = entry.name[:-4]
+                if not code.startswith(exclude):
+                    yield code, entry.path
+
+def ensure_sorted(df):
+    """按日期升序返回 df：源 CSV 通常已排好序，这里只做 O(N) 单调性检查，乱序时才排序"""
+    if df['日期'].is_monotonic_increasing:
+        return df
+    return df.sort_values('日期', ignore_index=True)
+
+def read_stock(file_path, columns=None):
+    """读取单只股票行情 CSV (只取 columns 列)：量价列直接按 float32 解析，不经过 float64 中间列；日期、代码保持字符串。
+    pyarrow 可用时直接调用 pyarrow.csv (单个小文件比 pd.read_csv(engine='pyarrow') 快约 4 倍，
+    后者每次调用都有参数转换与结果重组的开销)，未安装时用 pandas 并传入同样的列类型"""
+    if pacsv is None:
+        dtype = {c: np.float32 for c in FLOAT32_COLS}
+        dtype.update({c: str for c in STR_COLS})
+        return pd.read_csv(file_path, usecols=columns, dtype=dtype)
+    column_types = {c: pa.float32() for c in FLOAT32_COLS}
+    column_types.update({c: pa.string() for c in STR_COLS})
+    convert_options = pacsv.ConvertOptions(column_types=column_types, include_columns=columns or [])
+    return pacsv.read_csv(file_path, convert_options=convert_options).to_pandas()
+
+def load_all(stocks, columns, use_store=True):
+    """把 iter_stocks 产出的全部股票读成一张长表：首列为 代码 (categorical)，每只股票的行连续、按日期升序排列。
+    批量战法在这张表上用 groupby 一次算完全市场，不再逐文件派发进程。
+    合并库中 CSV 签名一致的股票直接从合并库读取，其余 (新增、有更新或合并库缺失的) 逐文件读取后接在后面。
+    columns 为 None 时读取全部列；use_store=False 时全部逐文件读取 (用于重建合并库)。"""
+    stocks = list(stocks)
+    stored = None
+    if use_store:
+        try:
+            stored, stocks = read_store(stocks, columns)
+        except Exception:
+            stored = None
+    known = [] if stored is None else list(stored['代码'].cat.categories)
+    codes, frames = [], []
+    for code, file_path in stocks:
+        try:
+            df = read_stock(file_path, columns)
+        except Exception:
+            continue
+        codes.append(code)
+        frames.append(ensure_sorted(df) if '日期' in df.columns else df)
+    if not frames:
+        return stored if stored is not None else pd.DataFrame(columns=['代码'] + list(columns or []))
+    df = pd.concat(frames, ignore_index=True)
+    # 代码列只存整数编码，不为每一行重复一份字符串；分组与分块边界都直接用编码
+    ids = np.repeat(np.arange(len(known), len(known) + len(codes), dtype=np.int32), [len(f) for f in frames])
+    df.insert(0, '代码', pd.Categorical.from_codes(ids, categories=known + codes))
+    if stored is not None:
+        # 两部分共用同一组类别，拼接后仍是 categorical
+        stored['代码'] = stored['代码'].cat.set_categories(known + codes)
+        df = pd.concat([stored, df], ignore_index=True)
+    return df
+
+def store_part(code):
+    """代码所在的合并库分片路径"""
+    return os.path.join(STORE_DIR, code[:STORE_PREFIX_LEN] + '.parquet')
+
+def csv_signature(file_path):
+    """CSV 内容签名：文件大小 + 最后一行 (含最新日期)。只读文件尾部，不解析；
+    与修改时间无关，git checkout、shutil.copy2 保留旧 mtime 都不影响判断"""
+    with open(file_path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 512))
+        last_line = f.read().rstrip(b'\r\n').rsplit(b'\n', 1)[-1]
+    return f"{size}:{last_line.decode('utf-8', 'replace')}"
+
+def store_signatures(path):
+    """合并库分片建库时记录的 {代码: CSV 签名}，分片不存在或无法读取时返回空字典"""
+    try:
+        meta = pq.read_schema(path).metadata or {}
+        return json.loads(meta.get(STORE_META_KEY, b'{}'))
+    except Exception:
+        return {}
+
+def read_store(stocks, columns=None):
+    """从合并库读取 stocks 中签名与当前 CSV 一致的股票，返回 (长表或 None, 未能从合并库读取的股票)。
+    列裁剪与按代码过滤都下推到 Parquet 读取层 (分片内按代码排序，不含所需代码的分片与行组按统计信息跳过)"""
+    signatures, hit, rest = {}, [], []
+    for code, file_path in stocks:
+        part = store_part(code)
+        if part not in signatures:
+            signatures[part] = store_signatures(part)
+        if signatures[part].get(code) == csv_signature(file_path):
+            hit.append(code)
+        else:
+            rest.append((code, file_path))
+    if not hit:
+        return None, rest
+    cols = None if columns is None else ['代码'] + [c for c in columns if c != '代码']
+    df = downcast(pd.read_parquet(STORE_DIR, columns=cols, filters=[('代码', 'in', hit)]))
+    # 各分片的代码字典合并后包含未请求的代码，去掉被过滤掉的类别
+    df['代码'] = df['代码'].astype('category').cat.remove_unused_categories()
+    # 签名一致却没有读到行的股票 (分片损坏等) 同样逐文件读取
+    missing = set(hit).difference(df['代码'].cat.categories)
+    rest.extend((code, file_path) for code, file_path in stocks if code in missing)
+    return df, rest
+
+def is_block_start(codes):
+    """长表代码列 -> 布尔数组，标记每只股票分块的首行。
+    相邻行代码按位置比较：categorical 列直接比较整数编码，其他列按位置比较原数组，不构造 shift 后的整列副本"""
+    keys = codes.cat.codes.to_numpy() if isinstance(codes.dtype, pd.CategoricalDtype) else codes.array
+    return np.r_[True, np.asarray(keys[1:] != keys[:-1], dtype=bool)]
+
+_TAIL_UFUNCS = {'max': np.maximum, 'min': np.minimum, 'sum': np.add, 'mean': np.add}
+
+def tail_stat(df, n, col, how):
+    """长表中每只股票最近 n 行 col 列的聚合 ('max'、'min'、'sum'、'mean')，以代码为索引。
+    长表按代码连续分块，直接由分块边界算出每只股票最后 n 行的区间，
+    用一次 ufunc.reduceat 完成全部归约，不再经过 groupby().tail() 生成中间表。"""
+    codes = df['代码']
+    arr = df[col].to_numpy()
+    if len(arr) == 0:
+        return pd.Series(dtype=arr.dtype)
+    starts = np.flatnonzero(is_block_start(codes))
+    ends = np.r_[starts[1:], len(arr)]
+    tail_starts = np.maximum(starts, ends - n)
+    # [尾部起点, 分块终点) 交错排列，偶数位即各股票尾部的归约结果；末尾的终点越界，去掉
+    bounds = np.column_stack([tail_starts, ends]).ravel()[:-1]
+    acc = np.float64 if how in ('sum', 'mean') else None
+    vals = _TAIL_UFUNCS[how].reduceat(arr, bounds, dtype=acc)[::2]
+    if how == 'mean':
+        vals = vals / (ends - tail_starts)
+    return pd.Series(vals.astype(arr.dtype, copy=False), index=pd.Index(codes.iloc[starts].array), name=col)
+
+@functools.lru_cache(maxsize=1)
+def load_names():
+    """股票代码(6位) -> 名称。名称表不存在时返回空字典。
+    pickle 中记录了名称表的修改时间，名称表未更新时直接复用，跳过 CSV 解析与 zfill。"""
+    if not os.path.exists(NAMES_FILE):
+        return {}
+    mtime = os.path.getmtime(NAMES_FILE)
+    try:
+        with open(NAMES_PICKLE, 'rb') as f:
+            cached_mtime, names = pickle.load(f)
+        if cached_mtime == mtime:
+            return names
+    except Exception:
+        pass
+    names_df = pd.read_csv(NAMES_FILE, dtype={'code': str})
+    names = dict(zip(names_df['code'].str.zfill(6), names_df['name']))
+    try:
+        with open(NAMES_PICKLE, 'wb') as f:
+            pickle.dump((mtime, names), f)
+    except OSError:
+        pass
+    return names
+
+_WORKER_NAMES = {} # 子进程中的股票名称映射，由 init_worker_names 设置
+
+def init_worker_names(names):
+    """进程池 initializer：名称映射每个子进程只传一次，不随每个任务重复序列化"""
+    global _WORKER_NAMES
+    _WORKER_NAMES = names
+
+def worker_names():
+    """当前子进程的股票名称映射 (未经 init_worker_names 设置时为空字典)"""
+    return _WORKER_NAMES
+
+def save_csv(df, path, encoding='utf-8-sig'):
+    """复盘结果表直接用 csv.writer 写出，格式同 df.to_csv(index=False)：含表头、缺失值写为空"""
+    out = df.astype(object)
+    for col in df.columns[df.dtypes == np.float32]:
+        out[col] = df[col].astype(str) # float32 按自身精度输出 (10.91 而非 10.90999984741211)
+    rows = out.where(df.notna(), '').itertuples(index=False, name=None)
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(df.columns)
+        writer.writerows(rows)
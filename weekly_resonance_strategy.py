@@ -1,9 +1,9 @@
 import pandas as pd
 import numpy as np
 import os
-import glob
 from datetime import datetime
-import multiprocessing as mp
+from indicators import sma
+from stock_utils import load_names, iter_stocks, load_all, is_block_start, save_csv
 
 """
 战法名称：周线共振主升战法 (Weekly Resonance Strategy)
@@ -17,114 +17,118 @@ import multiprocessing as mp
 
 # 配置参数
 DATA_PATH = './stock_data/'
-NAME_FILE = 'stock_names.csv'
 PRICE_MIN = 5.0
 PRICE_MAX = 20.0
+USE_COLS = ['日期', '开盘', '最高', '最低', '收盘', '成交量', '成交额'] # 只读取战法用到的列
+RESULT_COLS = ['code', 'price', 'score', 'signal_strength', 'action_advice', 'volume_ratio'] # 结果字典的列，建表时固定列序
+
+def to_weekly(df):
+    """日线聚合为周线 (周一至周日为一周，与 resample('W') 同一口径)。
+    日期已升序，同一周的行是连续的一段：开收盘直接按段首段尾取值，
+    高低量额用 ufunc.reduceat 一次归约，不经过 resample 的通用 apply 路径。
+    df 为 load_all 长表时在代码切换处同样断段，全部股票的周线一次算完，结果保留 代码 列。"""
+    # 周编号：1970-01-01 为周四，天数 +3 后整除 7 即从周一起算
+    days = df['日期'].to_numpy().astype('datetime64[D]').view('int64')
+    week_id = (days + 3) // 7
+    new_week = np.r_[True, week_id[1:] != week_id[:-1]]
+    if '代码' in df.columns:
+        new_week |= is_block_start(df['代码'])
+    starts = np.flatnonzero(new_week)
+    ends = np.r_[starts[1:], len(df)] - 1
+    weekly = pd.DataFrame({
+        '开盘': df['开盘'].to_numpy()[starts],
+        '最高': np.maximum.reduceat(df['最高'].to_numpy(), starts),
+        '最低': np.minimum.reduceat(df['最低'].to_numpy(), starts),
+        '收盘': df['收盘'].to_numpy()[ends],
+        '成交量': np.add.reduceat(df['成交量'].to_numpy(), starts),
+        '成交额': np.add.reduceat(df['成交额'].to_numpy(), starts),
+    })
+    if '代码' in df.columns:
+        weekly.insert(0, '代码', df['代码'].array[starts])
+    return weekly.dropna()
+
+def evaluate(code, latest_price, close_w, high_w, vol_w):
+    """单只股票的周线判定 (收盘、最高、成交量的周线数组)，命中返回结果字典，否则返回 None"""
+    # 2. 核心逻辑计算
+    # 计算均线
+    ma20 = sma(close_w, 20)
+    ma60 = sma(close_w, 60)
+    
+    # A. 趋势：20周线 > 60周线 且均向上
+    trend_ok = (ma20[-1] > ma60[-1]) and (ma20[-1] > ma20[-2])
 
-def analyze_stock(file_path):
-    try:
-        # 获取股票代码
-        code = os.path.basename(file_path).replace('.csv', '')
-        
-        # 基础过滤：排除ST和创业板(30)
-        if 'ST' in code or code.startswith('30'):
-            return None
-
-        df = pd.read_csv(file_path)
-        if df.empty or len(df) < 120: # 至少需要半年以上数据计算周线
-            return None
-
-        # 1. 价格过滤 (最新收盘价)
-        latest_price = df.iloc[-1]['收盘']
-        if not (PRICE_MIN <= latest_price <= PRICE_MAX):
-            return None
-
-        # --- 转换为周线数据 ---
-        df['日期'] = pd.to_datetime(df['日期'])
-        df.set_index('日期', inplace=True)
-        
-        # 聚合为周线
-        logic = {
-            '开盘': 'first',
-            '最高': 'max',
-            '最低': 'min',
-            '收盘': 'last',
-            '成交量': 'sum',
-            '成交额': 'sum'
-        }
-        df_w = df.resample('W').apply(logic).dropna()
-
-        # 2. 核心逻辑计算
-        # 计算均线
-        df_w['MA20'] = df_w['收盘'].rolling(window=20).mean()
-        df_w['MA60'] = df_w['收盘'].rolling(window=60).mean()
-        
-        # A. 趋势：20周线 > 60周线 且均向上
-        trend_ok = (df_w['MA20'].iloc[-1] > df_w['MA60'].iloc[-1]) and \
-                   (df_w['MA20'].iloc[-1] > df_w['MA20'].iloc[-2])
-
-        # B. 堆量：最近5周成交量重心上移 (连续放量)
-        vol_recent = df_w['成交量'].tail(5).values
-        volume_ok = all(vol_recent[i] > vol_recent[i-1] * 0.8 for i in range(1, 4)) # 允许小幅波动
-        
-        # C. 平台突破：过去10周最高价的突破
-        platform_high = df_w['最高'].iloc[-12:-1].max()
-        breakout = df_w['收盘'].iloc[-1] > platform_high
-
-        # 3. 评分系统与回测（简化版）
-        score = 0
-        if trend_ok: score += 30
-        if volume_ok: score += 30
-        if breakout: score += 40
-
-        if score < 70: # 只有高分才入选，实现“一击必中”
-            return None
-
-        # 4. 生成建议
-        suggestion = "观察"
-        strength = "一般"
-        if score >= 90:
-            strength = "极强 (主升浪起爆)"
-            suggestion = "激进买入/加仓"
-        elif score >= 70:
-            strength = "中等 (趋势形成)"
-            suggestion = "底仓试错"
+    # B. 堆量：最近5周成交量重心上移 (连续放量)
+    vol_recent = vol_w[-5:]
+    volume_ok = bool(np.all(vol_recent[1:4] > vol_recent[0:3] * 0.8)) # 允许小幅波动，相邻三组一次比较
+    
+    # C. 平台突破：过去10周最高价的突破
+    platform_high = high_w[-12:-1].max()
+    breakout = close_w[-1] > platform_high
 
-        return {
-            'code': code,
-            'price': latest_price,
-            'score': score,
-            'signal_strength': strength,
-            'action_advice': f"{suggestion} (突破位:{platform_high:.2f})",
-            'volume_ratio': round(df_w['成交量'].iloc[-1] / df_w['成交量'].iloc[-5:-1].mean(), 2)
-        }
+    # 3. 评分系统与回测（简化版）
+    score = 0
+    if trend_ok: score += 30
+    if volume_ok: score += 30
+    if breakout: score += 40
 
-    except Exception as e:
+    if score < 70: # 只有高分才入选，实现“一击必中”
         return None
 
-def main():
-    # 扫描目录
-    files = glob.glob(os.path.join(DATA_PATH, "*.csv"))
-    
-    # 并行处理加快速度
-    with mp.Pool(processes=mp.cpu_count()) as pool:
-        results = pool.map(analyze_stock, files)
-    
-    # 过滤空结果
-    final_list = [res for res in results if res is not None]
-    
-    # 匹配名称
-    if os.path.exists(NAME_FILE):
-        names_df = pd.read_csv(NAME_FILE, dtype={'code': str})
-        names_dict = dict(zip(names_df['code'], names_df['name']))
-    else:
-        names_dict = {}
-
-    output_df = pd.DataFrame(final_list)
+    # 4. 生成建议
+    suggestion = "观察"
+    strength = "一般"
+    if score >= 90:
+        strength = "极强 (主升浪起爆)"
+        suggestion = "激进买入/加仓"
+    elif score >= 70:
+        strength = "中等 (趋势形成)"
+        suggestion = "底仓试错"
+
+    return {
+        'code': code,
+        'price': latest_price,
+        'score': score,
+        'signal_strength': strength,
+        'action_advice': f"{suggestion} (突破位:{platform_high:.2f})",
+        'volume_ratio': round(vol_w[-1] / vol_w[-5:-1].mean(), 2)
+    }
+
+def screen(df):
+    """全市场长表一次筛选 (df 为 load_all 结果)，返回命中股票的结果表。
+    全部股票的日线一次聚合成周线，再逐股在周线数组切片上判定。"""
+    if df.empty:
+        return pd.DataFrame(columns=RESULT_COLS)
+    starts = np.flatnonzero(is_block_start(df['代码']))
+    ends = np.r_[starts[1:], len(df)]
+    codes = df['代码'].to_numpy()[starts]
+    latest_prices = df['收盘'].to_numpy()[ends - 1]
+
+    # --- 转换为周线数据，记下每只股票的周线区间 ---
+    df_w = to_weekly(df)
+    w_starts = np.flatnonzero(is_block_start(df_w['代码']))
+    w_spans = dict(zip(df_w['代码'].to_numpy()[w_starts], zip(w_starts, np.r_[w_starts[1:], len(df_w)])))
+    close_w, high_w, vol_w = (df_w[c].to_numpy() for c in ('收盘', '最高', '成交量'))
+
+    records = []
+    for code, n_days, latest_price in zip(codes, ends - starts, latest_prices):
+        # 1. 至少需要半年以上数据计算周线；价格过滤 (最新收盘价)
+        if n_days < 120 or not (PRICE_MIN <= latest_price <= PRICE_MAX) or code not in w_spans:
+            continue
+        lo, hi = w_spans[code]
+        try:
+            res = evaluate(code, latest_price, close_w[lo:hi], high_w[lo:hi], vol_w[lo:hi])
+        except Exception:
+            res = None
+        if res is not None:
+            records.append(res)
+    return pd.DataFrame.from_records(records, columns=RESULT_COLS)
+
+def save_results(output_df, names_dict):
+    """匹配名称、按分数排序并按年月目录保存"""
     if not output_df.empty:
-        output_df['name'] = output_df['code'].apply(lambda x: names_dict.get(x, "未知"))
-        # 按照分数排序，优中选优
-        output_df = output_df.sort_values(by='score', ascending=False)
+        output_df['name'] = output_df['code'].map(names_dict).fillna("未知")
+        # 按照分数排序，优中选优；同分按代码排序
+        output_df = output_df.sort_values(by=['score', 'code'], ascending=[False, True])
     
     # 创建年月目录
     now = datetime.now()
@@ -134,9 +138,14 @@ def main():
     
     # 保存结果
     file_name = f"weekly_resonance_strategy_{now.strftime('%Y%m%d_%H%M%S')}.csv"
-    output_df.to_csv(os.path.join(dir_path, file_name), index=False, encoding='utf-8-sig')
+    save_csv(output_df, os.path.join(dir_path, file_name))
     
     print(f"分析完成，筛选出 {len(output_df)} 只符合主升浪战法的潜力股。")
 
+def main():
+    # 基础过滤：排除ST和创业板(30)，在读取前完成，不读数据；其余股票读成一张长表一次筛选
+    files = ((c, p) for c, p in iter_stocks(DATA_PATH, ('30',)) if 'ST' not in c)
+    save_results(screen(load_all(files, USE_COLS)), load_names())
+
 if __name__ == "__main__":
     main()